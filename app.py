@@ -2,10 +2,14 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 
 # import your transpiler function
-from transpiler import transpile_code  # <-- adjust to your function name
+from transpiler import transpile_with_source_map  # <-- adjust to your function name
+from limits import DEFAULT_LIMITS, BudgetExceeded
+from optimizer import MAX_LEVEL
 
 app = Flask(__name__)
 CORS(app)  # allow frontend (port 5173) to access backend (port 5000)
+# flask answers 413 by itself to bodies way over the source limit (json escaping can make the body bigger than the code)
+app.config["MAX_CONTENT_LENGTH"] = 4 * DEFAULT_LIMITS.max_source_bytes
 
 @app.route("/transpile", methods=["POST"])
 def transpile():
@@ -15,9 +19,17 @@ def transpile():
     if not cpp_code:
         return jsonify({"error": "Empty input"}), 400
 
+    opt_level = data.get("opt_level", 0)
+    if type(opt_level) is not int or not 0 <= opt_level <= MAX_LEVEL:
+        return jsonify({"error": f"opt_level must be an integer between 0 and {MAX_LEVEL}"}), 400
+
     try:
-        python_code = transpile_code(cpp_code)  # your logic here
-        return jsonify({"output": python_code})
+        python_code, source_map = transpile_with_source_map(cpp_code, opt_level=opt_level, limits=DEFAULT_LIMITS)
+        # source_map lets the editor highlight which cpp code a python line came from
+        return jsonify({"output": python_code, "source_map": source_map})
+    except BudgetExceeded as e:
+        # too much code is 413 (payload too large), code that is too complex to handle is 422
+        return jsonify(e.to_dict()), 413 if e.limit == "source_bytes" else 422
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
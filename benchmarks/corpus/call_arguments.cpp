@@ -0,0 +1,23 @@
+#include <iostream>
+using namespace std;
+
+int dbl(int v) {
+    return v * 2;
+}
+
+int add(int a, int b) {
+    return a + b;
+}
+
+int main() {
+    int total = 0;
+    for (int i = 0; i < 1000; i++) {
+        int k = i;
+        total = total + dbl(++k) + add(i * 3, dbl(i + 1));
+    }
+    for (int j = 0; j < 3; j++) {
+        dbl(j);
+    }
+    cout << "total " << total;
+    return 0;
+}
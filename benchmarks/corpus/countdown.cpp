@@ -0,0 +1,13 @@
+#include <iostream>
+using namespace std;
+
+int main() {
+    int n = 1000000;
+    int steps = 0;
+    while (n > 0) {
+        n--;
+        steps++;
+    }
+    cout << "steps " << steps;
+    return 0;
+}
@@ -0,0 +1,9 @@
+#include <iostream>
+using namespace std;
+
+int main() {
+    char grade;
+    cin >> grade;
+    cout << "grade " << grade;
+    return 0;
+}
@@ -0,0 +1,25 @@
+#include <iostream>
+using namespace std;
+
+int square(int v) {
+    return v * v;
+}
+
+int clamp_low(int v, int low) {
+    if (v < low) {
+        return low;
+    }
+    return v;
+}
+
+int main() {
+    int total = 0;
+    int limit = 1000;
+    for (int i = 0; i < limit; i++) {
+        for (int j = 0; j < 1000; j++) {
+            total = total + square(i) - square(j) + clamp_low(j, 10);
+        }
+    }
+    cout << "total " << total;
+    return 0;
+}
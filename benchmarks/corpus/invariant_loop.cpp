@@ -0,0 +1,22 @@
+#include <iostream>
+using namespace std;
+
+int weight(int a, int b) {
+    int w = a * b;
+    return w + 1;
+}
+
+int main() {
+    int n = 200;
+    int m = 7;
+    int total = 0;
+    int i = 0;
+    while (i < n * 5) {
+        for (int j = 0; j < 200; j++) {
+            total = total + weight(n, m) * 2 + m * n - j;
+        }
+        i++;
+    }
+    cout << "total " << total;
+    return 0;
+}
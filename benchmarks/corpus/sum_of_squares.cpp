@@ -0,0 +1,13 @@
+#include <iostream>
+using namespace std;
+
+int main() {
+    int total = 0;
+    for (int i = 0; i < 1500; i++) {
+        for (int j = 0; j < 1000; j++) {
+            total = total + i * j - i * j + 1;
+        }
+    }
+    cout << "total " << total;
+    return 0;
+}
@@ -0,0 +1,97 @@
+# this document compares the cost of transpiling one file by starting python (what CI jobs and editor plugins did)
+# with the cost of asking a running daemon (daemon.py) :
+#   cold start        a new interpreter imports the transpiler and transpiles the file
+#   client process    a new interpreter runs the thin client (daemon_client.py), which asks the daemon
+#   round trip        one request over a connection that is already open (an editor plugin keeps one)
+#   pipelined         every file of the corpus sent at once over one connection, time per file
+#
+# run from the repository root :
+#     python -m benchmarks.daemon_latency
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.harness import CORPUS, programs
+from daemon_client import DaemonClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLD_START = (
+    "import sys\n"
+    "from transpiler import transpile_code\n"
+    "sys.stdout.write(transpile_code(open(sys.argv[1]).read()))\n"
+)
+
+def timed(function, repeat):
+    # milliseconds of every run
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def start_daemon(socket_path):
+    daemon = subprocess.Popen([sys.executable, "daemon.py", "--socket", socket_path],
+                              cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    daemon.stdout.readline()    # "listening on ...", printed once the socket accepts connections
+    return daemon
+
+def run(corpus=CORPUS, repeat=10):
+    files = [cpp_path for _, cpp_path, _ in programs(corpus)]
+    sources = []
+    for path in files:
+        with open(path, encoding="utf-8") as file:
+            sources.append(file.read())
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        socket_path = os.path.join(workdir, "daemon.sock")
+        daemon = start_daemon(socket_path)
+        try:
+            def cold():
+                for path in files:
+                    subprocess.run([sys.executable, "-c", COLD_START, path], cwd=ROOT, check=True, capture_output=True)
+
+            def client_process():
+                for path in files:
+                    subprocess.run([sys.executable, "daemon_client.py", "--socket", socket_path, path],
+                                   cwd=ROOT, check=True, capture_output=True)
+
+            with DaemonClient(socket_path) as client:
+                def round_trip():
+                    for code in sources:
+                        assert client.transpile(code)["ok"]
+
+                def pipelined():
+                    responses = client.pipeline([{"op": "transpile", "code": code} for code in sources])
+                    assert all(response["ok"] for response in responses)
+
+                # per file, so the four columns compare
+                for name, function in (("cold start", cold), ("client process", client_process),
+                                       ("round trip", round_trip), ("pipelined", pipelined)):
+                    results[name] = [sample / len(files) for sample in timed(function, repeat)]
+        finally:
+            daemon.terminate()
+            daemon.wait()
+    return results
+
+def report(results):
+    print(f"{'mode':<18}{'median (ms)':>14}{'min (ms)':>12}{'vs cold':>10}")
+    cold = statistics.median(results["cold start"])
+    for name, samples in results.items():
+        median = statistics.median(samples)
+        print(f"{name:<18}{median:>14.3f}{min(samples):>12.3f}{cold / median:>9.1f}x")
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description="Compare cold-start transpiles with daemon round trips")
+    arguments.add_argument("--corpus", default=CORPUS, help="directory of .cpp programs")
+    arguments.add_argument("--repeat", type=int, default=10, help="runs of every mode over the whole corpus")
+    options = arguments.parse_args()
+
+    report(run(options.corpus, options.repeat))
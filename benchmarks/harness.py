@@ -0,0 +1,184 @@
+# this document checks the transpiler against a real cpp compiler :
+# every program of the corpus is compiled with g++ and transpiled with transpile_code, both are run on the same stdin,
+# and their outputs must match. the runtime of each side is recorded too, so a change that makes the generated
+# python slower (compared to the native binary) shows up as a higher ratio.
+#
+# run from the repository root :
+#     python -m benchmarks.harness                          check every program of benchmarks/corpus
+#     python -m benchmarks.harness --record results.json    also save the timings
+#     python -m benchmarks.harness --baseline results.json  fail when a ratio got worse than the saved one
+#     python -m benchmarks.harness --opt-level 2            check the code produced at an optimization level
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, asdict
+from functools import partial
+
+from transpiler import transpile_code
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+TIMEOUT = 60.0      # seconds one compile or run may take, a program that loops forever fails instead of hanging
+
+# the generated code only defines main(), the harness calls it the way the cpp runtime would
+RUNNER = """
+{code}
+
+if "main" in globals():
+    main()
+"""
+
+# -----------------------------
+# RESULT OF ONE PROGRAM
+# -----------------------------
+
+@dataclass
+class Result:
+    name: str
+    matches: bool
+    cpp_seconds: float
+    python_seconds: float
+    expected: str = ""
+    actual: str = ""
+    error: str = ""
+
+    @property
+    def ratio(self):
+        return self.python_seconds / self.cpp_seconds if self.cpp_seconds else float("inf")
+
+# -----------------------------
+# RUNNING
+# -----------------------------
+
+def find_compiler():
+    for name in ("g++", "clang++", "c++"):
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+def programs(corpus):
+    # every foo.cpp of the corpus, with foo.in as its stdin when there is one
+    for name in sorted(os.listdir(corpus)):
+        if name.endswith(".cpp"):
+            stdin_path = os.path.join(corpus, name[:-4] + ".in")
+            yield name[:-4], os.path.join(corpus, name), stdin_path if os.path.exists(stdin_path) else None
+
+def timed_run(command, stdin_text, repeat, timeout=TIMEOUT):
+    # best of `repeat` runs, the least disturbed by whatever else the machine is doing
+    # raises subprocess.TimeoutExpired when one run takes longer than timeout seconds
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run(command, input=stdin_text, capture_output=True, text=True, timeout=timeout)
+        elapsed = time.perf_counter() - start
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr.strip() or f"exit code {completed.returncode}")
+        best = elapsed if best is None else min(best, elapsed)
+    return completed.stdout, best
+
+def normalize(output, strict):
+    # print() separates its values with spaces and ends with a newline where cout writes nothing,
+    # so unless asked to be strict, outputs are compared without their whitespace
+    return output if strict else re.sub(r"\s+", "", output)
+
+def run_program(name, cpp_path, stdin_path, compiler, workdir, repeat=3, strict=False, transpile=transpile_code,
+                timeout=TIMEOUT):
+    stdin_text = ""
+    if stdin_path:
+        with open(stdin_path, encoding="utf-8") as file:
+            stdin_text = file.read()
+
+    binary = os.path.join(workdir, name)
+    script = os.path.join(workdir, name + ".py")
+    try:
+        subprocess.run([compiler, "-O2", "-o", binary, cpp_path], check=True, capture_output=True, text=True,
+                       timeout=timeout)
+        with open(cpp_path, encoding="utf-8") as file:
+            code = transpile(file.read())
+        with open(script, "w", encoding="utf-8") as file:
+            file.write(RUNNER.format(code=code))
+
+        expected, cpp_seconds = timed_run([binary], stdin_text, repeat, timeout)
+        actual, python_seconds = timed_run([sys.executable, script], stdin_text, repeat, timeout)
+    except subprocess.TimeoutExpired as error:
+        return Result(name, False, 0.0, 0.0, error=f"timed out after {error.timeout} s")
+    except subprocess.CalledProcessError as error:
+        return Result(name, False, 0.0, 0.0, error=f"compile error: {error.stderr.strip()}")
+    except Exception as error:
+        return Result(name, False, 0.0, 0.0, error=str(error))
+
+    matches = normalize(expected, strict) == normalize(actual, strict)
+    return Result(name, matches, cpp_seconds, python_seconds, expected, actual)
+
+def run_corpus(corpus=CORPUS, repeat=3, strict=False, transpile=transpile_code, timeout=TIMEOUT):
+    compiler = find_compiler()
+    if compiler is None:
+        raise RuntimeError("No c++ compiler found (looked for g++, clang++ and c++)")
+    with tempfile.TemporaryDirectory() as workdir:
+        return [run_program(name, cpp_path, stdin_path, compiler, workdir, repeat, strict, transpile, timeout)
+                for name, cpp_path, stdin_path in programs(corpus)]
+
+# -----------------------------
+# REPORTING
+# -----------------------------
+
+def regressions(results, baseline, tolerance):
+    # programs whose python/cpp ratio grew by more than `tolerance` (0.25 = 25%) since the baseline was recorded
+    slower = []
+    for result in results:
+        previous = baseline.get(result.name)
+        if previous and result.matches and result.ratio > previous["ratio"] * (1 + tolerance):
+            slower.append((result, previous["ratio"]))
+    return slower
+
+def report(results):
+    print(f"{'program':<24}{'match':<8}{'cpp (s)':>10}{'python (s)':>12}{'ratio':>10}")
+    for result in results:
+        if result.error:
+            print(f"{result.name:<24}{'ERROR':<8}  {result.error}")
+            continue
+        print(f"{result.name:<24}{'yes' if result.matches else 'NO':<8}"
+              f"{result.cpp_seconds:>10.4f}{result.python_seconds:>12.4f}{result.ratio:>10.1f}")
+        if not result.matches:
+            print(f"    expected : {result.expected!r}")
+            print(f"    actual   : {result.actual!r}")
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description="Compare compiled cpp programs with their transpiled python")
+    arguments.add_argument("--corpus", default=CORPUS, help="directory of .cpp programs (and optional .in stdin files)")
+    arguments.add_argument("--repeat", type=int, default=3, help="runs per program, the fastest one is kept")
+    arguments.add_argument("--strict", action="store_true", help="compare outputs exactly, whitespace included")
+    arguments.add_argument("--record", help="write the timings to this json file")
+    arguments.add_argument("--baseline", help="json file written by --record to compare the ratios against")
+    arguments.add_argument("--tolerance", type=float, default=0.25, help="allowed ratio growth over the baseline")
+    arguments.add_argument("--opt-level", type=int, default=0, help="optimization level passed to transpile_code")
+    arguments.add_argument("--timeout", type=float, default=TIMEOUT,
+                           help="seconds a compile or a single run may take before the program counts as failed")
+    options = arguments.parse_args()
+
+    results = run_corpus(options.corpus, options.repeat, options.strict,
+                         partial(transpile_code, opt_level=options.opt_level), options.timeout)
+    report(results)
+    failed = [result for result in results if not result.matches]
+
+    slower = []
+    if options.baseline:
+        with open(options.baseline, encoding="utf-8") as file:
+            slower = regressions(results, json.load(file), options.tolerance)
+        for result, previous in slower:
+            print(f"{result.name}: ratio {result.ratio:.1f}, was {previous:.1f}")
+
+    if options.record:
+        with open(options.record, "w", encoding="utf-8") as file:
+            json.dump({result.name: {**asdict(result), "ratio": result.ratio} for result in results},
+                      file, indent=2, sort_keys=True)
+
+    if failed or slower:
+        raise SystemExit(1)
@@ -0,0 +1,59 @@
+# this document measures how fast the generated python runs at each optimization level of transpile_code
+# every program of the corpus is transpiled once per level and run on its stdin fixture; the output must stay the
+# same as at level 0 (the optimizer must never change what a program prints), and the time is compared to level 0
+#
+# run from the repository root :
+#     python -m benchmarks.opt_levels
+import argparse
+import os
+import sys
+import tempfile
+
+from benchmarks.harness import CORPUS, RUNNER, programs, timed_run
+from optimizer import MAX_LEVEL
+from transpiler import transpile_code
+
+def run_levels(corpus=CORPUS, levels=range(MAX_LEVEL + 1), repeat=3):
+    # {program: {level: (seconds, output)}}
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, cpp_path, stdin_path in programs(corpus):
+            with open(cpp_path, encoding="utf-8") as file:
+                code = file.read()
+            stdin_text = ""
+            if stdin_path:
+                with open(stdin_path, encoding="utf-8") as file:
+                    stdin_text = file.read()
+
+            results[name] = {}
+            for level in levels:
+                script = os.path.join(workdir, f"{name}_O{level}.py")
+                with open(script, "w", encoding="utf-8") as file:
+                    file.write(RUNNER.format(code=transpile_code(code, opt_level=level)))
+                output, seconds = timed_run([sys.executable, script], stdin_text, repeat)
+                results[name][level] = (seconds, output)
+    return results
+
+def report(results, levels):
+    print(f"{'program':<24}" + "".join(f"{'O' + str(level) + ' (s)':>12}" for level in levels) + f"{'speedup':>10}")
+    changed = []
+    for name, by_level in results.items():
+        base_seconds, base_output = by_level[levels[0]]
+        best = min(seconds for seconds, _ in by_level.values())
+        print(f"{name:<24}" + "".join(f"{by_level[level][0]:>12.4f}" for level in levels)
+              + f"{base_seconds / best:>9.2f}x")
+        changed += [(name, level) for level in levels if by_level[level][1] != base_output]
+    for name, level in changed:
+        print(f"{name}: output at O{level} differs from O{levels[0]}")
+    return changed
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description="Time the generated python at every optimization level")
+    arguments.add_argument("--corpus", default=CORPUS, help="directory of .cpp programs (and optional .in stdin files)")
+    arguments.add_argument("--repeat", type=int, default=3, help="runs per program and level, the fastest one is kept")
+    options = arguments.parse_args()
+
+    levels = list(range(MAX_LEVEL + 1))
+    if report(run_levels(options.corpus, levels, options.repeat), levels):
+        raise SystemExit(1)
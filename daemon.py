@@ -0,0 +1,127 @@
+# this document keeps the transpiler loaded in one long running process and serves it over a unix socket
+# editors and CI jobs then pay for a socket round trip instead of starting python and importing the pipeline
+# for every file, and the header cache of the preprocessor stays warm between requests
+# the protocol and the client are in daemon_client.py
+#
+#     python daemon.py                           serve on the default socket
+#     python daemon.py --socket /tmp/t.sock
+import argparse
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+
+from daemon_client import default_socket_path, recv_frame, send_frame
+from limits import DEFAULT_LIMITS, BudgetExceeded
+from transpiler import transpile_with_source_map
+
+# -----------------------------
+# REQUESTS
+# -----------------------------
+
+def handle_message(message, limits):
+    if not isinstance(message, dict):
+        return {"id": None, "ok": False, "error": "A request must be a json object"}
+    response = {"id": message.get("id")}
+    op = message.get("op")
+
+    if op == "ping":
+        return {**response, "ok": True}
+
+    if op != "transpile":
+        return {**response, "ok": False, "error": f"Unknown op {op!r}"}
+
+    try:
+        output, source_map = transpile_with_source_map(
+            message.get("code", ""),
+            message.get("filename"),
+            message.get("include_paths", ()),
+            int(message.get("opt_level", 0)),
+            limits,
+        )
+    except BudgetExceeded as error:
+        return {**response, "ok": False, **error.to_dict()}
+    except Exception as error:
+        return {**response, "ok": False, "error": str(error)}
+
+    response.update(ok=True, output=output)
+    if message.get("source_map"):
+        response["source_map"] = source_map
+    return response
+
+# -----------------------------
+# SERVER
+# -----------------------------
+
+class ConnectionHandler(socketserver.BaseRequestHandler):
+    # answers the requests of one connection in order until the client hangs up, which is all pipelining needs
+    def handle(self):
+        while True:
+            try:
+                message = recv_frame(self.request)
+            except (ConnectionError, ValueError) as error:
+                # a broken frame leaves the stream out of sync, the connection cannot be used any more
+                send_frame(self.request, {"id": None, "ok": False, "error": f"Bad frame: {error}"})
+                return
+            if message is None:
+                return
+            send_frame(self.request, handle_message(message, self.server.limits))
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, limits=DEFAULT_LIMITS):
+        remove_stale_socket(path)
+        super().__init__(path, ConnectionHandler)
+        os.chmod(path, 0o600)    # only the user who started the daemon may use it
+        self.path = path
+        self.limits = limits
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+def remove_stale_socket(path):
+    # a socket file left behind by a daemon that died would make bind() fail, but the file at path is only removed
+    # when it is a socket nobody answers on : not another running daemon, and not some unrelated file
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise RuntimeError(f"{path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except FileNotFoundError:
+        return
+    except ConnectionRefusedError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"A daemon is already listening on {path}")
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description="Serve the transpiler over a unix socket")
+    arguments.add_argument("--socket", default=default_socket_path(), help="socket path (default: %(default)s)")
+    arguments.add_argument("--unlimited", action="store_true", help="do not apply the default limits (limits.py)")
+    options = arguments.parse_args()
+
+    try:
+        server = DaemonServer(options.socket, None if options.unlimited else DEFAULT_LIMITS)
+    except RuntimeError as error:
+        raise SystemExit(str(error))
+    # stopped by a service manager (SIGTERM) the same way as by ctrl-c, so the socket file is removed either way
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"listening on {options.socket}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,168 @@
+# this document talks to the transpiler daemon (daemon.py) over its unix socket
+# it only imports the standard library, so starting it costs a bare interpreter and nothing of the transpiler
+#
+# protocol : every message is a frame = 4 byte big endian length + that many bytes of utf-8 json
+#   request   {"id": 1, "op": "transpile", "code": "...", "filename": null, "opt_level": 0, "source_map": false}
+#             {"id": 2, "op": "ping"}
+#   response  {"id": 1, "ok": true, "output": "...", "source_map": {...}}
+#             {"id": 1, "ok": false, "error": "...", ...}   (budget errors add limit / maximum / stage, see limits.py)
+# a connection can carry any number of requests, and requests can be sent before the previous answers arrive
+# (pipelining) : the daemon answers them in the order they were sent
+import argparse
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+
+HEADER = struct.Struct("!I")
+MAX_FRAME = 64 * 1024 * 1024
+
+def default_socket_path():
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(directory, f"cpp2py-{os.getuid()}.sock")
+
+# -----------------------------
+# FRAMING
+# -----------------------------
+
+def send_frame(sock, message):
+    payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+def recv_frame(sock):
+    # None when the other side closed the connection between two frames
+    header = recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    (length,) = HEADER.unpack(header)
+    if length > MAX_FRAME:
+        raise ConnectionError(f"Frame of {length} bytes is over the {MAX_FRAME} byte limit")
+    payload = recv_exactly(sock, length)
+    if payload is None:
+        raise ConnectionError("Connection closed in the middle of a frame")
+    return json.loads(payload.decode("utf-8"))
+
+def recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            if chunks:
+                raise ConnectionError("Connection closed in the middle of a frame")
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+# -----------------------------
+# CLIENT CLASS
+# -----------------------------
+
+class DaemonClient:
+    def __init__(self, path=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path or default_socket_path())
+        self.next_id = 0
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def message(self, op, **fields):
+        self.next_id += 1
+        return {"id": self.next_id, "op": op, **fields}
+
+    def request(self, op, **fields):
+        send_frame(self.sock, self.message(op, **fields))
+        return self.receive()
+
+    def receive(self):
+        response = recv_frame(self.sock)
+        if response is None:
+            raise ConnectionError("The daemon closed the connection before answering")
+        return response
+
+    def abort(self):
+        # makes the other thread of pipeline() stop waiting on the socket
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def transpile(self, code, filename=None, opt_level=0, source_map=False):
+        return self.request("transpile", code=code, filename=filename, opt_level=opt_level, source_map=source_map)
+
+    def pipeline(self, messages):
+        # sends every message without waiting, then collects the answers (in the same order)
+        # the sending happens on its own thread : with large batches the daemon starts answering before
+        # everything was sent, and someone has to read those answers or both sides would wait on each other
+        messages = [self.message(**message) for message in messages]
+        errors = []
+
+        def send():
+            try:
+                for message in messages:
+                    send_frame(self.sock, message)
+            except Exception as error:
+                errors.append(error)
+                self.abort()    # the answers to what was not sent will never come
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        responses = []
+        try:
+            for _ in messages:
+                responses.append(self.receive())
+        finally:
+            if len(responses) < len(messages):
+                self.abort()    # nothing reads the answers any more, the sender could wait forever
+            sender.join()
+            # the sender failing is what made the reading fail, so that is the error worth reporting
+            if errors:
+                raise errors[0]
+        return responses
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description="Transpile cpp files through a running transpiler daemon")
+    arguments.add_argument("files", nargs="+", help="cpp files to transpile")
+    arguments.add_argument("--socket", default=default_socket_path(), help="daemon socket (default: %(default)s)")
+    arguments.add_argument("-O", dest="opt_level", type=int, default=0, help="optimization level")
+    arguments.add_argument("-o", dest="output", help="directory for the .py files (default: print to stdout)")
+    arguments.add_argument("--pipeline", action="store_true", help="send every file at once instead of one by one")
+    options = arguments.parse_args()
+
+    requests = []
+    for path in options.files:
+        with open(path, encoding="utf-8") as file:
+            requests.append({"op": "transpile", "code": file.read(), "filename": os.path.abspath(path),
+                             "opt_level": options.opt_level})
+
+    with DaemonClient(options.socket) as client:
+        if options.pipeline:
+            responses = client.pipeline(requests)
+        else:
+            responses = [client.request(**request) for request in requests]
+
+    failed = False
+    for path, response in zip(options.files, responses):
+        if not response["ok"]:
+            failed = True
+            print(f"{path}: {response['error']}", file=sys.stderr)
+        elif options.output:
+            name = os.path.splitext(os.path.basename(path))[0] + ".py"
+            with open(os.path.join(options.output, name), "w", encoding="utf-8") as file:
+                file.write(response["output"])
+        else:
+            sys.stdout.write(response["output"])
+    if failed:
+        raise SystemExit(1)
@@ -2,6 +2,8 @@
 import re
 from dataclasses import dataclass
 
+from limits import Budget
+
 # -----------------------------
 # TOKEN DEFINITION
 # -----------------------------
@@ -11,15 +13,53 @@ class Token:
     type: str
     value: str
     line: int
+    column: int = 1     # 1-based, like line
+    offset: int = 0     # 0-based character offset into the source
+    source: str = None  # file the token was read from (None for the code passed in directly)
+
+    @property
+    def end_column(self):
+        return self.column + len(self.value)
+
+    @property
+    def end_offset(self):
+        return self.offset + len(self.value)
+
+# -----------------------------
+# SOURCE SPAN
+# -----------------------------
+
+# a span covers a range of the C++ source, from the first token of a construct to the end of its last token
+@dataclass
+class Span:
+    line: int
+    column: int
+    offset: int
+    end_line: int
+    end_column: int
+    end_offset: int
+    source: str = None
+
+    @classmethod
+    def between(cls, start, end):
+        # a construct can start in a header and end in the including file (through macros or includes),
+        # positions are only meaningful inside one file so such a span is cut to the start token
+        if end.source != start.source:
+            end = start
+        return cls(start.line, start.column, start.offset,
+                   end.line, end.end_column, end.end_offset, start.source)
 
 # -----------------------------
 # LEXER CLASS
 # -----------------------------
 
 class Lexer:
-    def __init__(self, code):
+    def __init__(self, code, source=None, budget=None):
         self.code = code
+        self.source = source
+        self.budget = budget or Budget()
         self.line = 1
+        self.line_start = 0     # offset at which the current line begins, used for columns
         self.tokens = []
 
         # keywords are similar to identifiers, therefore another set which separates keywords.....
@@ -56,25 +96,31 @@ class Lexer:
     def tokenize(self):
         # regex.finditer(self.code) scans the provided code and returns matches one by one (through loop), from regex (compiled above)
         for match in self.regex.finditer(self.code):
+            self.budget.tick("lexer")
             kind = match.lastgroup
             if kind is None:
                 raise RuntimeError("Unexpected unnamed match")
             value = match.group()
+            offset = match.start()
+            column = offset - self.line_start + 1
 
             if kind == "NEWLINE":
                 self.line += 1
+                self.line_start = match.end()
 
             elif kind == "SKIP" or kind == "COMMENT":
                 continue
 
             elif kind == "IDENTIFIER" and value in self.keywords:
-                self.tokens.append(Token("KEYWORD", value, self.line))
+                self.tokens.append(Token("KEYWORD", value, self.line, column, offset, self.source))
 
             elif kind == "MISMATCH":
-                raise RuntimeError(f"Unexpected character '{value}' at line {self.line}")
+                raise RuntimeError(f"Unexpected character '{value}' at line {self.line}, column {column}")
 
             else:
-                self.tokens.append(Token(kind, value, self.line))
+                self.tokens.append(Token(kind, value, self.line, column, offset, self.source))
+
+            self.budget.check_tokens(len(self.tokens), "lexer")
 
         return self.tokens
 
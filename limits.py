@@ -0,0 +1,98 @@
+# this document bounds how much work one transpile may do : source size, tokens, AST nodes, nesting depth and time
+# the lexer, preprocessor, parser, optimizer and generator check the budget as they go, and stop with BudgetExceeded
+# as soon as one limit is crossed, instead of running (and holding memory) until the input is exhausted
+import time
+from dataclasses import dataclass
+
+# -----------------------------
+# LIMITS
+# -----------------------------
+
+# None means unlimited, which is what the transpiler uses unless it is given limits
+@dataclass
+class Limits:
+    max_source_bytes: int = None    # the code passed in plus every header it includes
+    max_tokens: int = None          # after preprocessing (headers and macros expanded)
+    max_nodes: int = None
+    max_depth: int = None           # nested blocks, parentheses, else if chains, operator chains and macros
+    max_seconds: float = None       # wall time for the whole transpile
+
+# what the web app accepts from one request
+DEFAULT_LIMITS = Limits(
+    max_source_bytes=256 * 1024,
+    max_tokens=100_000,
+    max_nodes=100_000,
+    max_depth=100,
+    max_seconds=2.0,
+)
+
+# -----------------------------
+# ERROR
+# -----------------------------
+
+class BudgetExceeded(Exception):
+    def __init__(self, limit, maximum, stage):
+        self.limit = limit          # "source_bytes", "tokens", "nodes", "depth" or "seconds"
+        self.maximum = maximum
+        self.stage = stage          # "preprocessor", "lexer", "parser", "optimizer" or "generator"
+        super().__init__(f"Input exceeds the {limit} limit ({maximum}) in the {stage}")
+
+    def to_dict(self):
+        return {"error": str(self), "limit": self.limit, "maximum": self.maximum, "stage": self.stage}
+
+# -----------------------------
+# BUDGET
+# -----------------------------
+
+# one Budget per transpile, shared by every stage
+class Budget:
+    # time is only looked at every few calls to tick(), reading the clock for every token would cost more than it saves
+    TICKS_PER_CLOCK_CHECK = 256
+
+    def __init__(self, limits=None):
+        self.limits = limits or Limits()
+        self.source_bytes = 0
+        self.nodes = 0
+        self.depth = 0
+        self.ticks = 0
+        self.deadline = None
+        if self.limits.max_seconds is not None:
+            self.deadline = time.monotonic() + self.limits.max_seconds
+
+    def charge_source(self, code, stage):
+        if self.limits.max_source_bytes is not None:
+            self.charge_bytes(len(code.encode("utf-8")), stage)
+
+    def charge_bytes(self, count, stage):
+        # for sources that are not read again, like headers the preprocessor serves from its cache
+        if self.limits.max_source_bytes is None:
+            return
+        self.source_bytes += count
+        if self.source_bytes > self.limits.max_source_bytes:
+            raise BudgetExceeded("source_bytes", self.limits.max_source_bytes, stage)
+
+    def check_tokens(self, count, stage):
+        if self.limits.max_tokens is not None and count > self.limits.max_tokens:
+            raise BudgetExceeded("tokens", self.limits.max_tokens, stage)
+
+    def charge_node(self, stage):
+        self.nodes += 1
+        if self.limits.max_nodes is not None and self.nodes > self.limits.max_nodes:
+            raise BudgetExceeded("nodes", self.limits.max_nodes, stage)
+
+    def enter(self, stage):
+        self.depth += 1
+        if self.limits.max_depth is not None and self.depth > self.limits.max_depth:
+            raise BudgetExceeded("depth", self.limits.max_depth, stage)
+
+    def leave(self, levels=1):
+        self.depth -= levels
+
+    def tick(self, stage):
+        self.ticks += 1
+        if self.deadline is not None and self.ticks % self.TICKS_PER_CLOCK_CHECK == 0:
+            self.check_time(stage)
+
+    def check_time(self, stage):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise BudgetExceeded("seconds", self.limits.max_seconds, stage)
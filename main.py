@@ -15,7 +15,10 @@ from parser import (
     String,
     Number,
     Identifier,
+    walk,
 )
+from sourcemap import SourceMap
+from limits import Budget
 
 
 # ---------------------------------
@@ -23,14 +26,45 @@ from parser import (
 # ---------------------------------
 
 class CodeGenerator:
-    def __init__(self):
+    # bind_locals : inside a function, globals called in a loop (other functions, print, input) are first copied
+    # to local variables. python looks a local up much faster than a global or builtin, which matters in loops
+    def __init__(self, bind_locals=False, budget=None):
+        self.budget = budget or Budget()
         self.indent_level = 0
+        self.lines = []
+        self.source_map = SourceMap()
+        self.bind_locals = bind_locals
+        self.aliases = {}       # global name -> local name, for the function being generated
+        self.taken = set()      # every name of the program, aliases must not collide with them
 
     def indent(self):
         return "    " * self.indent_level
 
     def generate(self, node):
-        return self.generate_stmt(node)
+        self.lines = []
+        self.source_map = SourceMap()
+        self.taken = program_names(node)
+        self.generate_stmt(node)
+        if not self.lines:
+            return ""
+        return "\n".join(self.lines) + "\n"
+
+    # every line of python goes through emit(), which also remembers which cpp node it came from
+    def emit(self, text, node=None):
+        self.budget.tick("generator")
+        self.lines.append(f"{self.indent()}{text}")
+        if node is not None and node.span is not None:
+            line = self.lines[-1]
+            self.source_map.add(len(self.lines), len(self.indent()), len(line), node.span)
+
+    def generate_block(self, statements):
+        self.indent_level += 1
+        # python needs at least one statement in a block ({} in cpp, or everything removed by the optimizer)
+        if not statements:
+            self.emit("pass")
+        for stmt in statements:
+            self.generate_stmt(stmt)
+        self.indent_level -= 1
 
     # ---------------------------------
     # STATEMENT GENERATOR
@@ -38,54 +72,52 @@ class CodeGenerator:
 
     def generate_stmt(self, node):
         if isinstance(node, Program):
-            return "\n".join(self.generate_stmt(stmt) for stmt in node.statements if stmt)
+            for index, stmt in enumerate(stmt for stmt in node.statements if stmt):
+                # blank line between top level statements
+                if index:
+                    self.lines.append("")
+                self.generate_stmt(stmt)
 
         elif isinstance(node, FunctionDef):
             params = ", ".join(name for _, name in node.parameters)
-            result = f"{self.indent()}def {node.name}({params}):\n"
+            self.emit(f"def {node.name}({params}):", node)
+            self.aliases = self.local_aliases(node) if self.bind_locals else {}
             self.indent_level += 1
-            if not node.body:
-                result += f"{self.indent()}pass\n"
-            else:
-                for stmt in node.body:
-                    result += self.generate_stmt(stmt)
+            for name, alias in self.aliases.items():
+                self.emit(f"{alias} = {name}")
             self.indent_level -= 1
-            return result
+            self.generate_block(node.body)
+            self.aliases = {}
 
         elif isinstance(node, VarDeclaration):
             if node.value:
                 value = self.generate_expr(node.value)
             else:
                 value = "None"
-            return f"{self.indent()}{node.name} = {value}\n"
+            self.emit(f"{node.name} = {value}", node)
 
         elif isinstance(node, Assignment):
             value = self.generate_expr(node.value)
-            return f"{self.indent()}{node.name} = {value}\n"
+            self.emit(f"{node.name} = {value}", node)
 
         elif isinstance(node, CoutStatement):
             values = ", ".join(self.generate_expr(v) for v in node.values)
-            return f"{self.indent()}print({values})\n"
+            self.emit(f"{self.aliases.get('print', 'print')}({values})", node)
 
         elif isinstance(node, CinStatement):
-            result = ""
             for var in node.variables:
-                result += f"{self.indent()}{var} = input()\n"
-            return result
+                self.emit(f"{var} = {self.aliases.get('input', 'input')}()", node)
 
         elif isinstance(node, UnaryOp):
             operand = self.generate_expr(node.operand)
             if node.operator == "++":
-                return f"{self.indent()}{operand} += 1\n"
+                self.emit(f"{operand} += 1", node)
             else:
-                return f"{self.indent()}{operand} -= 1\n"
+                self.emit(f"{operand} -= 1", node)
 
         elif isinstance(node, IfStatement):
-            result = f"{self.indent()}if {self.generate_expr(node.condition)}:\n"
-            self.indent_level += 1
-            for stmt in node.body:
-                result += self.generate_stmt(stmt)
-            self.indent_level -= 1
+            self.emit(f"if {self.generate_expr(node.condition)}:", node)
+            self.generate_block(node.body)
             current = node
 
             # Handle chained else-if
@@ -95,11 +127,8 @@ class CodeGenerator:
                     and isinstance(current.else_body[0], IfStatement)
             ):
                 next_if = current.else_body[0]
-                result += f"{self.indent()}elif {self.generate_expr(next_if.condition)}:\n"
-                self.indent_level += 1
-                for stmt in next_if.body:
-                    result += self.generate_stmt(stmt)
-                self.indent_level -= 1
+                self.emit(f"elif {self.generate_expr(next_if.condition)}:", next_if)
+                self.generate_block(next_if.body)
                 current = next_if
 
             # Final else
@@ -107,46 +136,63 @@ class CodeGenerator:
                     len(current.else_body) == 1
                     and isinstance(current.else_body[0], IfStatement)
             ):
-                result += f"{self.indent()}else:\n"
-                self.indent_level += 1
-                for stmt in current.else_body:
-                    result += self.generate_stmt(stmt)
-                self.indent_level -= 1
-            return result
+                self.emit("else:")
+                self.generate_block(current.else_body)
 
 
         elif isinstance(node, WhileLoop):
-            result = f"{self.indent()}while {self.generate_expr(node.condition)}:\n"
-            self.indent_level += 1
-            for stmt in node.body:
-                result += self.generate_stmt(stmt)
-            self.indent_level -= 1
-            return result
+            self.emit(f"while {self.generate_expr(node.condition)}:", node)
+            self.generate_block(node.body)
 
         elif isinstance(node, ForLoop):
             if isinstance(node.init, (VarDeclaration, Assignment)) and isinstance(node.condition, BinaryOp):
                 var = node.init.name
                 start = self.generate_expr(node.init.value)
                 end = self.generate_expr(node.condition.right)
-                result = f"{self.indent()}for {var} in range({start}, {end}):\n"
+                self.emit(f"for {var} in range({start}, {end}):", node)
             else:
-                return f"{self.indent()}# Unsupported for-loop\n"
-            self.indent_level += 1
-            for stmt in node.body:
-                result += self.generate_stmt(stmt)
-            self.indent_level -= 1
-            return result
+                self.emit("# Unsupported for-loop", node)
+                return
+            self.generate_block(node.body)
 
         elif isinstance(node, ReturnStatement):
             value = self.generate_expr(node.value)
-            return f"{self.indent()}return {value}\n"
+            self.emit(f"return {value}", node)
 
 
         elif isinstance(node, FunctionCall):
             call = self.generate_expr(node)
-            return f"{self.indent()}{call}\n"
+            self.emit(call, node)
 
-        return ""
+    # ---------------------------------
+    # LOCAL BINDING
+    # ---------------------------------
+
+    def local_aliases(self, function):
+        # globals called inside the loops of the function, with the local name each one gets
+        local = {name for _, name in function.parameters} | {
+            node.name for node in walk(function) if isinstance(node, (VarDeclaration, Assignment))
+        }
+        called = set()
+        for loop in walk(function):
+            if not isinstance(loop, (WhileLoop, ForLoop)):
+                continue
+            for node in walk(loop):
+                if isinstance(node, FunctionCall) and node.name not in local:
+                    called.add(node.name)
+                elif isinstance(node, CoutStatement):
+                    called.add("print")
+                elif isinstance(node, CinStatement):
+                    called.add("input")
+
+        aliases = {}
+        for name in sorted(called):
+            alias = f"_{name}"
+            while alias in self.taken:
+                alias = f"_{alias}"
+            self.taken.add(alias)
+            aliases[name] = alias
+        return aliases
 
     # ---------------------------------
     # EXPRESSION GENERATOR
@@ -161,7 +207,7 @@ class CodeGenerator:
 
         elif isinstance(node, FunctionCall):
             args = ", ".join(self.generate_expr(a) for a in node.arguments)
-            return f"{node.name}({args})"
+            return f"{self.aliases.get(node.name, node.name)}({args})"
 
         elif isinstance(node, UnaryOp):
             operand = self.generate_expr(node.operand)
@@ -181,3 +227,15 @@ class CodeGenerator:
             return node.name
 
         return ""
+
+
+def program_names(node):
+    names = set()
+    for child in walk(node):
+        if isinstance(child, (Identifier, FunctionDef, FunctionCall, VarDeclaration, Assignment)):
+            names.add(child.name)
+        if isinstance(child, FunctionDef):
+            names.update(name for _, name in child.parameters)
+        elif isinstance(child, CinStatement):
+            names.update(child.variables)
+    return names
@@ -0,0 +1,460 @@
+# this document optimizes the AST between the parser and the code generator
+# python pays much more than cpp for function calls and for every statement it runs, so these passes
+# remove work from the generated code without changing what it prints
+#
+# optimization levels (transpile_code(..., opt_level=N)) :
+#   0   no changes, the AST goes to the generator as parsed
+#   1   dead code elimination : statements after a return, variables that are never read
+#   2   level 1, and small functions called inside loops are inlined at the call site
+#   3   level 2, and loop invariant expressions are computed once before the loop
+#       (the code generator also binds globals called inside loops to locals at this level, see CodeGenerator)
+import copy
+from collections import Counter
+from itertools import count
+
+from parser import (
+    Program,
+    FunctionDef,
+    FunctionCall,
+    CoutStatement,
+    CinStatement,
+    UnaryOp,
+    VarDeclaration,
+    Assignment,
+    IfStatement,
+    ForLoop,
+    WhileLoop,
+    ReturnStatement,
+    BinaryOp,
+    String,
+    Number,
+    Identifier,
+    Node,
+    walk,
+)
+from limits import Budget
+
+MAX_LEVEL = 3
+
+def optimize(program, level=1, budget=None):
+    # budget (see limits.py) is ticked as the passes walk the tree, so a huge program stops with BudgetExceeded
+    # in the middle of a pass instead of once it is over
+    if level < 0 or level > MAX_LEVEL:
+        raise ValueError(f"Optimization level must be between 0 and {MAX_LEVEL}, got {level}")
+    budget = budget or Budget()
+    if level >= 1:
+        eliminate_dead_code(program, budget)
+    if level >= 2:
+        inline_functions(program, budget)
+    if level >= 3:
+        LoopHoister(program, budget).hoist()
+    return program
+
+# -----------------------------
+# HELPERS
+# -----------------------------
+
+def blocks(node):
+    # every statement list directly held by node (a function body, both sides of an if, a loop body)
+    if isinstance(node, Program):
+        return [node.statements]
+    if isinstance(node, (FunctionDef, WhileLoop, ForLoop)):
+        return [node.body]
+    if isinstance(node, IfStatement):
+        return [node.body] + ([node.else_body] if node.else_body else [])
+    return []
+
+def rewrite(node, function):
+    # rebuilds the tree bottom up : every node is replaced by function(node), once its children were rewritten
+    for name, value in vars(node).items():
+        if isinstance(value, Node):
+            setattr(node, name, rewrite(value, function))
+        elif isinstance(value, list):
+            value[:] = [rewrite(item, function) if isinstance(item, Node) else item for item in value]
+    return function(node)
+
+def has_side_effects(expression):
+    # a call may print, read or change globals, and x++ changes x
+    return any(isinstance(node, (FunctionCall, UnaryOp)) for node in walk(expression))
+
+def read_names(node):
+    return {child.name for child in walk(node) if isinstance(child, Identifier)}
+
+# -----------------------------
+# DEAD CODE ELIMINATION
+# -----------------------------
+
+def eliminate_dead_code(program, budget=None):
+    budget = budget or Budget()
+    for node in walk(program):
+        budget.tick("optimizer")
+        for statements in blocks(node):
+            statements[:] = reachable(statements)
+
+    # a variable is only dropped when nothing in its scope reads it. scopes are approximated by whole
+    # functions (and the whole program for globals), so a name read anywhere keeps every declaration of it.
+    # dropping one declaration can leave another unread (int a = 1; int b = a;) : every scope counts how many
+    # times each name is read, dropping a declaration takes the names its value reads off those counts, and
+    # the names that fall to zero go on the worklist
+    program_reads = read_counts(program)
+    scopes = [(program_reads, declarations(program.statements, recurse=False))]
+    for function in program.statements:
+        if isinstance(function, FunctionDef):
+            scopes.append((read_counts(function), declarations(function.body, recurse=True)))
+
+    dropped = set()
+    worklist = [(index, name) for index, (reads, declared) in enumerate(scopes) for name in declared if not reads[name]]
+    while worklist:
+        index, name = worklist.pop()
+        budget.tick("optimizer")
+        for stmt in scopes[index][1].pop(name, ()):
+            dropped.add(id(stmt))
+            if stmt.value is None:
+                continue
+            for read, uses in read_counts(stmt.value).items():
+                # the program scope (0) counts the reads inside every function as well
+                for counted in {index, 0}:
+                    reads, declared = scopes[counted]
+                    reads[read] -= uses
+                    if not reads[read] and read in declared:
+                        worklist.append((counted, read))
+
+    if dropped:
+        for node in walk(program):
+            budget.tick("optimizer")
+            for statements in blocks(node):
+                statements[:] = [stmt for stmt in statements if id(stmt) not in dropped]
+    return program
+
+def reachable(statements):
+    # nothing after a statement that always returns can run
+    for index, stmt in enumerate(statements):
+        if always_returns(stmt):
+            return statements[:index + 1]
+    return statements
+
+def always_returns(stmt):
+    if isinstance(stmt, ReturnStatement):
+        return True
+    if isinstance(stmt, IfStatement) and stmt.else_body:
+        return any(map(always_returns, stmt.body)) and any(map(always_returns, stmt.else_body))
+    return False
+
+def read_counts(node):
+    return Counter(child.name for child in walk(node) if isinstance(child, Identifier))
+
+def declarations(statements, recurse):
+    # name -> the declarations of it that can go when the name is never read
+    found = {}
+    for stmt in statements:
+        if isinstance(stmt, VarDeclaration) and (stmt.value is None or not has_side_effects(stmt.value)):
+            found.setdefault(stmt.name, []).append(stmt)
+        if recurse:
+            for block in blocks(stmt):
+                for name, declared in declarations(block, recurse).items():
+                    found.setdefault(name, []).extend(declared)
+    return found
+
+# -----------------------------
+# INLINING
+# -----------------------------
+
+# A function is inlined when its whole body is "return <expression>" and that expression only uses the
+# parameters : no calls (so it cannot be recursive, and has no side effects), no globals (which a local
+# variable at the call site could hide). Only calls inside loops are replaced, that is where the
+# python call overhead adds up.
+def inline_functions(program, budget=None):
+    budget = budget or Budget()
+    candidates = {
+        stmt.name: stmt for stmt in program.statements
+        if isinstance(stmt, FunctionDef) and inlinable(stmt)
+    }
+    if not candidates:
+        return program
+
+    # a call used as a statement (sq(i);) is left alone, its value is thrown away and the expression put in
+    # its place would not be a statement the generator can emit
+    statements = {id(stmt) for node in walk(program) for block in blocks(node) for stmt in block}
+    statements.update(id(node.update) for node in walk(program) if isinstance(node, ForLoop))
+
+    def inline_call(node):
+        budget.tick("optimizer")
+        if isinstance(node, FunctionCall) and node.name in candidates and id(node) not in statements:
+            return inline(candidates[node.name], node) or node
+        return node
+
+    for loop in [node for node in walk(program) if isinstance(node, (WhileLoop, ForLoop))]:
+        # the outermost loop rewrites the calls of the loops nested in it as well, running it twice is harmless
+        rewrite(loop, inline_call)
+    return program
+
+def inlinable(function):
+    if len(function.body) != 1 or not isinstance(function.body[0], ReturnStatement):
+        return False
+    expression = function.body[0].value
+    parameters = {name for _, name in function.parameters}
+    return not has_side_effects(expression) and read_names(expression) <= parameters
+
+def inline(function, call):
+    # returns the body expression with the arguments put in place of the parameters, or None when
+    # that would evaluate an argument more than once, or drop an argument with side effects
+    if len(call.arguments) != len(function.parameters):
+        return None
+
+    expression = function.body[0].value
+    arguments = {}
+    for (_, name), argument in zip(function.parameters, call.arguments):
+        # the generator parenthesizes a BinaryOp but not ++x / --x (x + 1), which would bind to the
+        # operators around it once put in the body : dbl(++k) would become (k + 1 * 2)
+        if not isinstance(argument, (Identifier, Number, String, BinaryOp, FunctionCall)):
+            return None
+        uses = sum(1 for node in walk(expression) if isinstance(node, Identifier) and node.name == name)
+        simple = isinstance(argument, (Identifier, Number, String))
+        if not (simple or uses == 1 or (uses == 0 and not has_side_effects(argument))):
+            return None
+        arguments[name] = argument
+    if sum(1 for argument in call.arguments if has_side_effects(argument)) > 1:
+        return None    # the body may read the parameters in another order than the call evaluates the arguments
+
+    def put_argument(node):
+        if isinstance(node, Identifier) and node.name in arguments:
+            return copy.deepcopy(arguments[node.name])
+        return node
+
+    inlined = rewrite(copy.deepcopy(expression), put_argument)
+    inlined.span = call.span
+    return inlined
+
+# -----------------------------
+# LOOP INVARIANT CODE MOTION
+# -----------------------------
+
+# Moves expressions whose value cannot change between iterations out of while and for loops :
+#
+#     while (i < n * m) {              _licm_0 = (n * m)
+#         x = x + f(k) * 2;     →      if (i < _licm_0):
+#         i++;                             _licm_1 = f(k)
+#     }                                    while (i < _licm_0):
+#                                              x = (x + (_licm_1 * 2))
+#                                              i += 1
+#
+# An expression is moved when
+#   - it has no side effects : no ++/--, and only calls to pure functions (no cout/cin, no globals, only pure calls)
+#   - none of its variables is assigned anywhere in the loop (and when the loop calls something impure,
+#     only variables local to the function qualify, since that call could change a global)
+#   - it would run on every iteration anyway : it is in the while condition, or in the leading statements of the
+#     body, before anything that prints, reads, returns or branches
+# Moving an expression out of the body makes it run even when the loop runs zero times, so those expressions are
+# computed under an if that repeats the loop condition (for loops : start < end, the same test range() makes).
+class LoopHoister:
+    def __init__(self, program, budget=None):
+        self.program = program
+        self.budget = budget or Budget()
+        self.pure = pure_functions(program, self.budget)
+        self.temps = count()
+
+    def hoist(self):
+        self.hoist_block(self.program.statements, set())
+        return self.program
+
+    def hoist_block(self, statements, local):
+        result = []
+        for stmt in statements:
+            self.budget.tick("optimizer")
+            if isinstance(stmt, FunctionDef):
+                self.hoist_block(stmt.body, local_names(stmt))
+                result.append(stmt)
+                continue
+            # inner loops first, whatever they hoist becomes a leading statement the outer loop can look at
+            for block in blocks(stmt):
+                self.hoist_block(block, local)
+            if isinstance(stmt, (WhileLoop, ForLoop)):
+                result.extend(self.hoist_loop(stmt, local))
+            else:
+                result.append(stmt)
+        statements[:] = result
+
+    def hoist_loop(self, loop, local):
+        if isinstance(loop, ForLoop) and not (
+                isinstance(loop.init, (VarDeclaration, Assignment)) and isinstance(loop.condition, BinaryOp)
+        ):
+            return [loop]    # not a loop the generator turns into range(), leave it alone
+
+        assigned = assigned_names(loop)
+        calls_impure = any(
+            isinstance(node, FunctionCall) and node.name not in self.pure for node in walk(loop)
+        )
+
+        def invariant(expression):
+            names = read_names(expression)
+            return (
+                self.side_effect_free(expression)
+                and not names & assigned
+                and (not calls_impure or names <= local)
+            )
+
+        before = []
+        if isinstance(loop, WhileLoop):
+            # the condition runs before the first iteration too, no guard needed
+            before = self.assign(candidates(loop.condition, invariant), [loop])
+
+        inside = []
+        for expression in leading_expressions(loop.body, self.side_effect_free):
+            for candidate in candidates(expression, invariant):
+                if candidate not in inside:
+                    inside.append(candidate)
+
+        if not inside:
+            return before + [loop]
+        if runs_at_least_once(loop):
+            return before + self.assign(inside, [loop]) + [loop]
+        guard = self.guard(loop)
+        if guard is None:
+            return before + [loop]
+        hoisted = self.assign(inside, [loop])
+        stmt = IfStatement(guard, hoisted + [loop])
+        stmt.span = loop.span
+        return before + [stmt]
+
+    def assign(self, expressions, parts):
+        # one temporary per distinct expression, every occurrence inside parts reads the temporary instead
+        temps = []
+        for expression in expressions:
+            if any(expression == hoisted for hoisted, _ in temps):
+                continue
+            temps.append((copy.deepcopy(expression), f"_licm_{next(self.temps)}"))
+        for part in parts:
+            substitute(part, temps)
+
+        statements = []
+        for expression, name in temps:
+            stmt = Assignment(name, expression)
+            stmt.span = expression.span
+            statements.append(stmt)
+        return statements
+
+    def guard(self, loop):
+        if isinstance(loop, WhileLoop):
+            condition = loop.condition
+        else:
+            condition = BinaryOp(loop.init.value, "<", loop.condition.right)
+        # the guard evaluates the condition once more, so it must not do anything else
+        if not self.side_effect_free(condition):
+            return None
+        return copy.deepcopy(condition)
+
+    def side_effect_free(self, expression):
+        for node in walk(expression):
+            if isinstance(node, UnaryOp):
+                return False
+            if isinstance(node, FunctionCall) and node.name not in self.pure:
+                return False
+        return True
+
+def runs_at_least_once(loop):
+    # for loops over constant bounds (for (int i = 0; i < 10; i++)) need no guard
+    if not isinstance(loop, ForLoop):
+        return False
+    start, end = loop.init.value, loop.condition.right
+    if not (isinstance(start, Number) and isinstance(end, Number)):
+        return False
+    try:
+        return int(start.value) < int(end.value)
+    except ValueError:
+        return False    # float bounds, range() would not accept them anyway
+
+def pure_functions(program, budget=None):
+    # functions that only read their parameters and locals, print and read nothing, and only call pure functions.
+    # starts from every function and removes the ones that break a rule until nothing changes (handles recursion)
+    budget = budget or Budget()
+    functions = {stmt.name: stmt for stmt in program.statements if isinstance(stmt, FunctionDef)}
+    pure = set(functions)
+    changed = True
+    while changed:
+        changed = False
+        for name in sorted(pure):
+            budget.tick("optimizer")
+            if not is_pure(functions[name], pure):
+                pure.discard(name)
+                changed = True
+    return pure
+
+def is_pure(function, pure):
+    local = local_names(function)
+    for node in walk(function):
+        if isinstance(node, (CoutStatement, CinStatement)):
+            return False
+        if isinstance(node, FunctionCall) and node.name not in pure:
+            return False
+        if isinstance(node, (Identifier, Assignment)) and node.name not in local:
+            return False
+    return True
+
+def local_names(function):
+    return {name for _, name in function.parameters} | {
+        node.name for node in walk(function) if isinstance(node, VarDeclaration)
+    }
+
+def assigned_names(node):
+    names = set()
+    for child in walk(node):
+        if isinstance(child, (Assignment, VarDeclaration)):
+            names.add(child.name)
+        elif isinstance(child, CinStatement):
+            names.update(child.variables)
+        elif isinstance(child, UnaryOp) and isinstance(child.operand, Identifier):
+            names.add(child.operand.name)
+    return names
+
+def leading_expressions(body, side_effect_free):
+    # expressions evaluated on every iteration, before anything observable happens in it
+    expressions = []
+    for stmt in body:
+        if isinstance(stmt, (VarDeclaration, Assignment)):
+            if stmt.value is not None:
+                expressions.append(stmt.value)
+            if stmt.value is None or side_effect_free(stmt.value):
+                continue
+        elif isinstance(stmt, UnaryOp):
+            continue
+        elif isinstance(stmt, CoutStatement):
+            expressions.extend(stmt.values)
+        elif isinstance(stmt, (FunctionCall, ReturnStatement)):
+            expressions.append(stmt)
+        elif isinstance(stmt, (IfStatement, WhileLoop)):
+            expressions.append(stmt.condition)
+        elif isinstance(stmt, ForLoop) and isinstance(stmt.init, (VarDeclaration, Assignment)):
+            expressions.append(stmt.init.value)
+        break
+    return expressions
+
+def candidates(expression, invariant):
+    # the largest invariant parts of an expression worth a temporary : operations and calls, not plain names or numbers
+    if isinstance(expression, ReturnStatement):
+        return candidates(expression.value, invariant)
+    if isinstance(expression, (BinaryOp, FunctionCall)) and invariant(expression):
+        return [expression]
+    found = []
+    if isinstance(expression, BinaryOp):
+        found += candidates(expression.left, invariant) + candidates(expression.right, invariant)
+    elif isinstance(expression, FunctionCall):
+        for argument in expression.arguments:
+            found += candidates(argument, invariant)
+    return found
+
+def substitute(node, temps):
+    # top down, so that a whole hoisted expression is replaced before its parts are looked at
+    for name, value in vars(node).items():
+        if isinstance(value, Node):
+            setattr(node, name, replacement(value, temps))
+        elif isinstance(value, list):
+            value[:] = [replacement(item, temps) if isinstance(item, Node) else item for item in value]
+
+def replacement(node, temps):
+    for expression, name in temps:
+        if node == expression:
+            identifier = Identifier(name)
+            identifier.span = node.span
+            return identifier
+    substitute(node, temps)
+    return node
@@ -1,99 +1,120 @@
 from dataclasses import dataclass
 
+from lexer import Span
+from limits import Budget
+
 # -----------------------------
 # AST NODE DEFINITIONS
 # -----------------------------
 
+class Node:
+    # Span of C++ source the node was parsed from, filled in by the parser.
+    # kept off the dataclass fields so that == and repr() of nodes stay as before
+    span = None
+
 @dataclass
-class Program:
+class Program(Node):
     statements: list
 
 @dataclass
-class FunctionDef:
+class FunctionDef(Node):
     return_type: str
     name: str
     parameters: list
     body: list
 
 @dataclass
-class FunctionCall:
+class FunctionCall(Node):
     name: str
     arguments: list
 
 @dataclass
-class CoutStatement:
+class CoutStatement(Node):
     values: list
 
 @dataclass
-class CinStatement:
+class CinStatement(Node):
     variables: list
 
 @dataclass
-class UnaryOp:
+class UnaryOp(Node):
     operator: str
     operand: object
     postfix: bool = False
 
 @dataclass
-class VarDeclaration:
+class VarDeclaration(Node):
     var_type: str
     name: str
     value: object
 
 @dataclass
-class Assignment:
+class Assignment(Node):
     name: str
     value: object
 
 @dataclass
-class IfStatement:
+class IfStatement(Node):
     condition: object
     body: list
     else_body: object = None
 
 @dataclass
-class ForLoop:
+class ForLoop(Node):
     init: object
     condition: object
     update: object
     body: list
 
 @dataclass
-class WhileLoop:
+class WhileLoop(Node):
     condition: object
     body: list
 
 @dataclass
-class ReturnStatement:
+class ReturnStatement(Node):
     value: object
 
 @dataclass
-class BinaryOp:
+class BinaryOp(Node):
     left: object
     operator: str
     right: object
 
 @dataclass
-class String:
+class String(Node):
     value: str
 
 @dataclass
-class Number:
+class Number(Node):
     value: str
 
 @dataclass
-class Identifier:
+class Identifier(Node):
     name: str
 
 
+def walk(node):
+    # yields node and every node below it (depth first, in source order)
+    yield node
+    for value in vars(node).values():
+        if isinstance(value, Node):
+            yield from walk(value)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, Node):
+                    yield from walk(item)
+
+
 # -----------------------------
 # PARSER CLASS
 # -----------------------------
 
 class Parser:
-    def __init__(self, tokens):
+    def __init__(self, tokens, budget=None):
         self.tokens = tokens
         self.pos = 0
+        self.budget = budget or Budget()
 
     # -----------------------------
     # Utility Methods
@@ -111,6 +132,15 @@ class Parser:
             return token
         raise Exception(f"Unexpected token {token}, expected {token_type}")
 
+    def mark(self, node, start):
+        # records the span from start token to the last token eaten, so generated code can point back at the source
+        # every node passes through here, so this is also where the node budget is charged
+        if node is not None:
+            node.span = Span.between(start, self.tokens[self.pos - 1])
+            self.budget.charge_node("parser")
+            self.budget.tick("parser")
+        return node
+
     # -----------------------------
     # Entry Point
     # -----------------------------
@@ -118,7 +148,8 @@ class Parser:
     def parse(self):
         statements = []
         while self.current_token() is not None:
-            stmt =self.statement()
+            start = self.current_token()
+            stmt = self.mark(self.statement(), start)
             if stmt is None:
                 continue
             statements.append(stmt)
@@ -153,9 +184,9 @@ class Parser:
 
         elif token.type == "OPERATOR" and token.value in ("++", "--"):
             operator = self.eat("OPERATOR").value
-            name = self.eat("IDENTIFIER").value
+            name_token = self.eat("IDENTIFIER")
             self.eat("DELIMITER")  # ;
-            return UnaryOp(operator, Identifier(name), postfix=False)
+            return UnaryOp(operator, self.mark(Identifier(name_token.value), name_token), postfix=False)
 
         elif token.type == "IDENTIFIER":
             if token.value == "cout":
@@ -173,10 +204,10 @@ class Parser:
                     self.tokens[self.pos + 1].type == "OPERATOR" and \
                     self.tokens[self.pos + 1].value in ("++", "--"):
 
-                name = self.eat("IDENTIFIER").value
+                name_token = self.eat("IDENTIFIER")
                 operator = self.eat("OPERATOR").value
                 self.eat("DELIMITER")  # ;
-                return UnaryOp(operator, Identifier(name), postfix=True)
+                return UnaryOp(operator, self.mark(Identifier(name_token.value), name_token), postfix=True)
             else:
                 return self.assignment()
 
@@ -189,6 +220,7 @@ class Parser:
 
     def block(self):
         statements = []
+        self.budget.enter("parser")
 
         # Expect {
         self.eat("DELIMITER")  # should be '{'
@@ -196,13 +228,15 @@ class Parser:
         while self.current_token() is not None and \
                 not (self.current_token().type == "DELIMITER" and self.current_token().value == "}"):
 
-            stmt = self.statement()
+            start = self.current_token()
+            stmt = self.mark(self.statement(), start)
             if stmt is not None:
                 statements.append(stmt)
 
         # Expect '}'
         self.eat("DELIMITER")  # should be '}'
 
+        self.budget.leave()
         return statements
 
     # -----------------------------
@@ -230,7 +264,10 @@ class Parser:
 
         while self.current_token().value != ")":
             param_type = self.eat("KEYWORD").value
-            param_name = self.eat("IDENTIFIER").value
+            # a declaration may leave the parameter unnamed : int add(int, int);
+            param_name = None
+            if self.current_token().type == "IDENTIFIER":
+                param_name = self.eat("IDENTIFIER").value
             parameters.append((param_type, param_name))
 
             if self.current_token().value == ",":
@@ -238,6 +275,14 @@ class Parser:
 
         self.eat("DELIMITER")  # )
 
+        # forward declaration (int add(int a, int b);), python needs no prototypes so it is ignored like includes
+        if self.current_token() and self.current_token().value == ";":
+            self.eat("DELIMITER")
+            return None
+
+        if any(param_name is None for _, param_name in parameters):
+            raise Exception(f"Unnamed parameter in definition of {name}")
+
         body = self.block()
 
         return FunctionDef(return_type, name, parameters, body)
@@ -368,7 +413,11 @@ class Parser:
             # checking if that else was for 'else if' or only for 'else'
             if self.current_token().type == "KEYWORD" and \
             self.current_token().value == "if":
-                else_body = [self.if_statement()]
+                start = self.current_token()
+                # a chain of else if nests one if_statement() call per link
+                self.budget.enter("parser")
+                else_body = [self.mark(self.if_statement(), start)]
+                self.budget.leave()
 
             else:
                 else_body = self.block()
@@ -384,10 +433,11 @@ class Parser:
         self.eat("DELIMITER")  # (
 
         # Initialization
+        start = self.current_token()
         if self.current_token().type == "KEYWORD":
-            init = self.variable_declaration(expect_semicolon=False)
+            init = self.mark(self.variable_declaration(expect_semicolon=False), start)
         elif self.current_token().type == "IDENTIFIER":
-            init = self.assignment(expect_semicolon=False)
+            init = self.mark(self.assignment(expect_semicolon=False), start)
         else:
             init = None
 
@@ -447,8 +497,12 @@ class Parser:
     #           factor()       ← base values (your current term body)
     # -----------------------------
 
+    # comparison() is where every parenthesis recurses back to, so nesting depth is counted here
     def comparison(self):
+        self.budget.enter("parser")
+        start = self.current_token()
         left = self.expression()
+        folds = 0
 
         while (
                 self.current_token()
@@ -457,12 +511,17 @@ class Parser:
         ):
             operator = self.eat("OPERATOR").value
             right = self.expression()
-            left = BinaryOp(left, operator, right)
+            left = self.mark(BinaryOp(left, operator, right), start)
+            self.budget.enter("parser")
+            folds += 1
 
+        self.budget.leave(folds + 1)
         return left
 
     def expression(self):
+        start = self.current_token()
         left = self.term()
+        folds = 0
 
         while (
                 self.current_token()
@@ -471,12 +530,18 @@ class Parser:
         ):
             operator = self.eat("OPERATOR").value
             right = self.term()
-            left = BinaryOp(left, operator, right)
+            left = self.mark(BinaryOp(left, operator, right), start)
+            # every operator folded into left makes the tree one level deeper (1 + 1 + ... + 1 is left deep)
+            self.budget.enter("parser")
+            folds += 1
 
+        self.budget.leave(folds)
         return left
 
     def term(self):
+        start = self.current_token()
         left = self.factor()
+        folds = 0
 
         while (
                 self.current_token()
@@ -485,8 +550,11 @@ class Parser:
         ):
             operator = self.eat("OPERATOR").value
             right = self.factor()
-            left = BinaryOp(left, operator, right)
+            left = self.mark(BinaryOp(left, operator, right), start)
+            self.budget.enter("parser")
+            folds += 1
 
+        self.budget.leave(folds)
         return left
 
     def factor(self):
@@ -497,28 +565,30 @@ class Parser:
                 and token.value in ("++", "--")
         ):
             operator = self.eat("OPERATOR").value
+            self.budget.enter("parser")
             operand = self.factor()
+            self.budget.leave()
 
             if not isinstance(operand, Identifier):
                 raise Exception("++/-- can only be applied to identifiers")
 
-            return UnaryOp(operator, operand, postfix=False)
+            return self.mark(UnaryOp(operator, operand, postfix=False), token)
 
         elif token.type == "NUMBER":
-            return Number(self.eat("NUMBER").value)
+            return self.mark(Number(self.eat("NUMBER").value), token)
 
         elif token.type == "FLOAT":
-            return Number(self.eat("FLOAT").value)
+            return self.mark(Number(self.eat("FLOAT").value), token)
 
         elif token.type == "STRING":
-            return String(self.eat("STRING").value)
+            return self.mark(String(self.eat("STRING").value), token)
 
 
         elif token.type == "IDENTIFIER":
             name = self.eat("IDENTIFIER").value
             # If next token is '(' → function call
             if self.current_token() and self.current_token().value == "(":
-                return self.function_call(name)
+                return self.mark(self.function_call(name), token)
 
             # Postfix ++ or --
             elif (
@@ -526,9 +596,10 @@ class Parser:
                     and self.current_token().type == "OPERATOR"
                     and self.current_token().value in ("++", "--")
             ):
+                operand = self.mark(Identifier(name), token)
                 operator = self.eat("OPERATOR").value
-                return UnaryOp(operator, Identifier(name), postfix=True)
-            return Identifier(name)
+                return self.mark(UnaryOp(operator, operand, postfix=True), token)
+            return self.mark(Identifier(name), token)
 
         elif token.value == "(":
             self.eat("DELIMITER")
@@ -0,0 +1,406 @@
+# this document runs before the lexer : it resolves local #include "..." files, #define macros and #if/#ifdef blocks
+# the result is a single stream of tokens (the same Token objects the lexer produces), ready for the parser
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from lexer import Lexer, Token
+from limits import Budget
+
+# -----------------------------
+# HEADER CACHE
+# -----------------------------
+
+# Every header is preprocessed and tokenized once per process.
+# key   : (path, macros defined when it was included, #pragma once headers already seen)
+# value : (tokens, macros after the header, headers it included, headers marked #pragma once, files)
+# the macros are part of the key because they decide what the header expands to (include guards, #ifdef ...)
+# files holds (path, modification time, size) of the header and of every header it pulled in : the cached tokens
+# contain all of them, so an entry is only used while none of them changed on disk.
+# least recently used entries are dropped past MAX_HEADER_CACHE, a long running process (daemon.py) would
+# otherwise keep every edit of every header forever
+# the daemon preprocesses on several threads at once, every access to the cache holds _header_cache_lock
+# (but not the preprocessing of a header that missed, which would serialize every request)
+MAX_HEADER_CACHE = 512
+_header_cache = OrderedDict()
+_header_cache_lock = threading.Lock()
+
+def clear_header_cache():
+    with _header_cache_lock:
+        _header_cache.clear()
+
+def file_state(path):
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size
+
+def unchanged(files):
+    # a header that was removed since makes the entry stale too, preprocessing again reports the missing #include
+    try:
+        return all(file_state(state[0]) == state for state in files)
+    except OSError:
+        return False
+
+@lru_cache(maxsize=4096)
+def _macro_tokens(body):
+    # tokens of a macro body, lexed once per distinct body
+    return tuple(Lexer(body).tokenize())
+
+# -----------------------------
+# DIRECTIVE PATTERNS
+# -----------------------------
+
+DIRECTIVE = re.compile(r"\s*#\s*(\w*)\s*(.*)")
+LOCAL_INCLUDE = re.compile(r'"([^"]+)"')
+SYSTEM_INCLUDE = re.compile(r"<[^>]+>")
+DEFINE = re.compile(r"([A-Za-z_]\w*)(\(?)\s*(.*)")
+
+MAX_INCLUDE_DEPTH = 200
+
+# -----------------------------
+# PREPROCESSOR CLASS
+# -----------------------------
+
+class Preprocessor:
+    def __init__(self, code, filename=None, include_paths=(), defines=None, budget=None):
+        self.code = code
+        self.budget = budget or Budget()
+        self.filename = filename
+        self.include_paths = list(include_paths)
+        self.macros = dict(defines or {})   # name -> body text
+        self.includes = set()               # every header pulled in (directly or not), useful for dependency tracking
+        self.once = set()                   # headers that said #pragma once
+        self.stack = []                     # headers currently being included, innermost last
+
+    def tokenize(self):
+        tokens, self.macros = self.process(self.code, self.filename, self.macros)
+        return tokens
+
+    # -----------------------------
+    # ONE FILE
+    # -----------------------------
+
+    # Works in two passes :
+    #   1. go through the lines, run the directives, and blank out (with spaces) every line the lexer must not see.
+    #      blanking instead of deleting keeps the line, column and offset of every remaining token the same as in the file.
+    #      each directive that changes the macros or pulls in a header is recorded as an event for its line
+    #   2. lex what is left, then walk the tokens, replaying the events in line order : headers are spliced in
+    #      where they were included, and identifiers are expanded with the macros defined at that point
+    def process(self, code, path, macros):
+        self.budget.charge_source(code, "preprocessor")
+        initial = dict(macros)
+        macros = dict(macros)
+        lines = code.split("\n")
+        events = []         # (line, macros after the directive, tokens to splice in)
+
+        # every #if level pushes [parent active, this branch active, some branch already taken]
+        conditions = []
+        active = True
+
+        index = 0
+        while index < len(lines):
+            self.budget.tick("preprocessor")
+            line_no = index + 1
+            text = lines[index]
+            match = DIRECTIVE.match(text)
+
+            if not match or is_system_include(match):
+                if not active:
+                    lines[index] = blank(text)
+                index += 1
+                continue
+
+            # directive continued over several lines with a trailing backslash
+            directive_text = text
+            while directive_text.endswith("\\") and index + 1 < len(lines):
+                lines[index] = blank(lines[index])
+                index += 1
+                directive_text = directive_text[:-1] + " " + lines[index]
+            lines[index] = blank(lines[index])
+            index += 1
+
+            name, argument = DIRECTIVE.match(directive_text).groups()
+            argument = strip_comment(argument)
+
+            if name in ("if", "ifdef", "ifndef"):
+                if not active:
+                    taken = False
+                elif name == "if":
+                    taken = evaluate(argument, macros, line_no, self.budget)
+                else:
+                    taken = (macro_name(argument, line_no) in macros) == (name == "ifdef")
+                conditions.append([active, taken, taken])
+                active = active and taken
+
+            elif name in ("elif", "else", "endif"):
+                if not conditions:
+                    raise RuntimeError(f"#{name} without #if at line {line_no}")
+                frame = conditions[-1]
+                if name == "endif":
+                    conditions.pop()
+                    active = frame[0]
+                    continue
+                taken = False
+                if frame[0] and not frame[2]:
+                    taken = True if name == "else" else evaluate(argument, macros, line_no, self.budget)
+                frame[1] = taken
+                frame[2] = frame[2] or taken
+                active = frame[0] and taken
+
+            elif not active:
+                continue
+
+            elif name == "define":
+                define = DEFINE.match(argument)
+                if not define:
+                    raise RuntimeError(f"Invalid #define at line {line_no}")
+                macro, parenthesis, body = define.groups()
+                if parenthesis:
+                    raise RuntimeError(f"Function-like macro '{macro}' is not supported (line {line_no})")
+                macros[macro] = body.strip()
+                events.append((line_no, dict(macros), ()))
+
+            elif name == "undef":
+                macros.pop(macro_name(argument, line_no), None)
+                events.append((line_no, dict(macros), ()))
+
+            elif name == "include":
+                include = LOCAL_INCLUDE.match(argument)
+                if not include:
+                    raise RuntimeError(f"Invalid #include at line {line_no}")
+                header = self.resolve(include.group(1), path, line_no)
+                if header in self.once:
+                    continue
+                tokens, macros = self.include(header, macros)
+                events.append((line_no, dict(macros), tokens))
+
+            elif name == "pragma":
+                if argument == "once" and path is not None:
+                    self.once.add(path)
+
+            else:
+                raise RuntimeError(f"Unsupported directive #{name} at line {line_no}")
+
+        if conditions:
+            raise RuntimeError(f"Unterminated #if in {path or 'input'}")
+
+        return self.expand(Lexer("\n".join(lines), path, self.budget).tokenize(), events, initial), macros
+
+    # -----------------------------
+    # INCLUDES
+    # -----------------------------
+
+    def resolve(self, name, path, line_no):
+        # a local include is looked up next to the file that includes it, then in the include paths
+        directories = ([os.path.dirname(path)] if path else []) + self.include_paths
+        if not os.path.isabs(name):
+            for directory in directories:
+                candidate = os.path.join(directory, name)
+                if os.path.isfile(candidate):
+                    return os.path.realpath(candidate)
+        raise RuntimeError(f"Cannot resolve #include \"{name}\" at line {line_no}")
+
+    def include(self, header, macros):
+        if len(self.stack) >= MAX_INCLUDE_DEPTH:
+            raise RuntimeError(f"#include nested too deeply ({' -> '.join(self.stack)})")
+
+        key = (header, frozenset(macros.items()), frozenset(self.once))
+        with _header_cache_lock:
+            cached = _header_cache.get(key)
+            if cached is not None:
+                _header_cache.move_to_end(key)
+        if cached is not None and not unchanged(cached[4]):
+            cached = None
+        if cached is not None:
+            # the same bytes a miss would have read, so the source limit does not depend on what is cached
+            self.budget.charge_bytes(sum(size for _, _, size in cached[4]), "preprocessor")
+        else:
+            # a fresh preprocessor, so that includes and #pragma once seen inside the header are recorded for the cache too
+            inner = Preprocessor("", include_paths=self.include_paths, budget=self.budget)
+            inner.stack = self.stack + [header]
+            inner.once = set(self.once)
+            with open(header, encoding="utf-8") as file:
+                tokens, after = inner.process(file.read(), header, macros)
+            files = tuple(file_state(path) for path in sorted({header} | inner.includes))
+            cached = (tuple(tokens), after, frozenset(inner.includes), frozenset(inner.once), files)
+            with _header_cache_lock:
+                _header_cache[key] = cached
+                _header_cache.move_to_end(key)
+                if len(_header_cache) > MAX_HEADER_CACHE:
+                    _header_cache.popitem(last=False)
+
+        tokens, after, includes, once, _ = cached
+        self.includes.add(header)
+        self.includes.update(includes)
+        self.once.update(once)
+        return tokens, dict(after)
+
+    # -----------------------------
+    # MACRO EXPANSION
+    # -----------------------------
+
+    def expand(self, tokens, events, macros):
+        output = []
+        events = iter(events)
+        event = next(events, None)
+
+        for token in tokens:
+            while event is not None and event[0] < token.line:
+                macros = self.replay(event, output)
+                event = next(events, None)
+            self.expand_token(token, macros, output, set())
+
+        while event is not None:
+            self.replay(event, output)
+            event = next(events, None)
+
+        return output
+
+    def replay(self, event, output):
+        _, macros, tokens = event
+        output.extend(tokens)
+        self.budget.check_tokens(len(output), "preprocessor")
+        return macros
+
+    # macros can multiply tokens (#define B A A, #define C B B, ...), so the count is checked as the output grows
+    def expand_token(self, token, macros, output, expanding):
+        self.budget.tick("preprocessor")
+        if token.type != "IDENTIFIER" or token.value not in macros or token.value in expanding:
+            output.append(token)
+            self.budget.check_tokens(len(output), "preprocessor")
+            return
+        # every token of the body takes the position of the macro use, so errors and source maps point at the use
+        self.budget.enter("preprocessor")
+        for body_token in _macro_tokens(macros[token.value]):
+            self.expand_token(
+                Token(body_token.type, body_token.value, token.line, token.column, token.offset, token.source),
+                macros, output, expanding | {token.value},
+            )
+        self.budget.leave()
+
+# -----------------------------
+# HELPERS
+# -----------------------------
+
+def is_system_include(match):
+    # #include <...> is left alone, the lexer already turns it into an INCLUDE token that the parser skips
+    return match.group(1) == "include" and SYSTEM_INCLUDE.match(match.group(2)) is not None
+
+def blank(text):
+    return " " * len(text)
+
+def strip_comment(text):
+    return re.sub(r"//.*|/\*.*?\*/", "", text).strip()
+
+def macro_name(argument, line_no):
+    match = re.fullmatch(r"[A-Za-z_]\w*", argument)
+    if not match:
+        raise RuntimeError(f"Expected a macro name at line {line_no}, got '{argument}'")
+    return argument
+
+# -----------------------------
+# #if EXPRESSIONS
+# -----------------------------
+
+CONDITION_TOKEN = re.compile(r"\s*(\d+|[A-Za-z_]\w*|\|\||&&|==|!=|<=|>=|[!<>+\-*/%()])")
+
+# binary operators from lowest to highest precedence
+PRECEDENCE = [("||",), ("&&",), ("==", "!="), ("<", ">", "<=", ">="), ("+", "-"), ("*", "/", "%")]
+
+# macros, parentheses and unary operators nest, and each level is a recursive call : they are counted against
+# the depth budget the same way expand_token counts macro bodies
+def evaluate(expression, macros, line_no, budget=None):
+    budget = budget or Budget()
+    tokens = condition_tokens(expression, macros, line_no, set(), budget)
+    position, value = evaluate_level(tokens, 0, 0, line_no, budget)
+    if position != len(tokens):
+        raise RuntimeError(f"Invalid #if expression at line {line_no}")
+    return value != 0
+
+def condition_tokens(expression, macros, line_no, expanding, budget):
+    # splits the expression, resolving defined(...) first and then replacing macros by their bodies
+    raw = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = CONDITION_TOKEN.match(expression, position)
+        if not match:
+            raise RuntimeError(f"Invalid #if expression at line {line_no}")
+        raw.append(match.group(1))
+        position = match.end()
+
+    tokens = []
+    index = 0
+    while index < len(raw):
+        token = raw[index]
+        if token == "defined":
+            if raw[index + 1:index + 2] == ["("]:
+                name, closing, index = raw[index + 2:index + 3], raw[index + 3:index + 4], index + 4
+                if closing != [")"]:
+                    raise RuntimeError(f"Invalid #if expression at line {line_no}")
+            else:
+                name, index = raw[index + 1:index + 2], index + 2
+            if not name or not re.fullmatch(r"[A-Za-z_]\w*", name[0]):
+                raise RuntimeError(f"Invalid #if expression at line {line_no}")
+            tokens.append("1" if name[0] in macros else "0")
+            continue
+        if re.fullmatch(r"[A-Za-z_]\w*", token):
+            if token in macros and token not in expanding:
+                budget.enter("preprocessor")
+                tokens.extend(condition_tokens(macros[token] or "0", macros, line_no, expanding | {token}, budget))
+                budget.leave()
+            else:
+                # like in cpp, an identifier that is not a macro counts as 0
+                tokens.append("0")
+        else:
+            tokens.append(token)
+        index += 1
+    return tokens
+
+def evaluate_level(tokens, position, level, line_no, budget):
+    if level == len(PRECEDENCE):
+        return evaluate_unary(tokens, position, line_no, budget)
+
+    position, left = evaluate_level(tokens, position, level + 1, line_no, budget)
+    while position < len(tokens) and tokens[position] in PRECEDENCE[level]:
+        operator = tokens[position]
+        position, right = evaluate_level(tokens, position + 1, level + 1, line_no, budget)
+        if operator in ("/", "%") and right == 0:
+            raise RuntimeError(f"Division by zero in #if at line {line_no}")
+        left = {
+            "||": lambda: int(bool(left) or bool(right)),
+            "&&": lambda: int(bool(left) and bool(right)),
+            "==": lambda: int(left == right),
+            "!=": lambda: int(left != right),
+            "<": lambda: int(left < right),
+            ">": lambda: int(left > right),
+            "<=": lambda: int(left <= right),
+            ">=": lambda: int(left >= right),
+            "+": lambda: left + right,
+            "-": lambda: left - right,
+            "*": lambda: left * right,
+            "/": lambda: int(left / right),
+            "%": lambda: left - int(left / right) * right,
+        }[operator]()
+    return position, left
+
+def evaluate_unary(tokens, position, line_no, budget):
+    if position >= len(tokens):
+        raise RuntimeError(f"Invalid #if expression at line {line_no}")
+    token = tokens[position]
+    if token in ("!", "-", "+"):
+        budget.enter("preprocessor")
+        position, value = evaluate_unary(tokens, position + 1, line_no, budget)
+        budget.leave()
+        return position, {"!": int(not value), "-": -value, "+": value}[token]
+    if token == "(":
+        budget.enter("preprocessor")
+        position, value = evaluate_level(tokens, position + 1, 0, line_no, budget)
+        budget.leave()
+        if position >= len(tokens) or tokens[position] != ")":
+            raise RuntimeError(f"Missing ')' in #if at line {line_no}")
+        return position + 1, value
+    if token.isdigit():
+        return position + 1, int(token)
+    raise RuntimeError(f"Invalid #if expression at line {line_no}")
@@ -0,0 +1,321 @@
+# this document transpiles a whole project : every .cpp file (translation unit) becomes a python module,
+# and a call to a function defined in another file becomes an import of that module
+# files that call each other (a.cpp calls b.cpp which calls a.cpp) cannot use "from b import g" : whichever
+# module python loads first is still half defined when the other one imports from it. Between those files the
+# import is "import b" and the calls are written b.g(...), which only look g up when they run
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from main import CodeGenerator
+from parser import Parser, FunctionDef, FunctionCall, walk
+from preprocessor import Preprocessor
+
+SOURCE_EXTENSIONS = (".cpp", ".cc", ".cxx")
+MANIFEST = ".transpile-manifest.json"
+
+# -----------------------------
+# TRANSLATION UNIT
+# -----------------------------
+
+@dataclass
+class Unit:
+    path: str                       # relative to the project root
+    module: str                     # python module it becomes (util/math.cpp -> util.math)
+    defines: set                    # functions defined in this file (headers included)
+    calls: set                      # functions it calls
+    includes: list                  # headers it pulls in, relative to the root when inside it
+    digest: str                     # hash of the file and of every header it includes
+    imports: dict = field(default_factory=dict)     # module -> names imported from it
+    qualified: set = field(default_factory=set)     # modules of imports that are in a cycle with this one
+
+def module_name(path):
+    module = os.path.splitext(path)[0].replace(os.sep, ".")
+    if not all(part.isidentifier() for part in module.split(".")):
+        raise RuntimeError(f"{path} does not make a valid python module name")
+    return module
+
+# -----------------------------
+# WORKERS
+# (top level functions, so they can be sent to other processes)
+# -----------------------------
+
+def scan_unit(root, path, include_paths):
+    # preprocesses and parses one file, keeping only what the dependency graph needs
+    full_path = os.path.join(root, path)
+    with open(full_path, encoding="utf-8") as file:
+        code = file.read()
+
+    preprocessor = Preprocessor(code, full_path, include_paths)
+    ast = Parser(preprocessor.tokenize()).parse()
+
+    nodes = list(walk(ast))
+    defines = {node.name for node in nodes if isinstance(node, FunctionDef)}
+    calls = {node.name for node in nodes if isinstance(node, FunctionCall)}
+
+    digest = hashlib.sha256(code.encode())
+    includes = []
+    for header in sorted(preprocessor.includes):
+        with open(header, "rb") as file:
+            digest.update(header.encode() + b"\0" + file.read())
+        relative = os.path.relpath(header, root)
+        includes.append(header if relative.startswith("..") else relative)
+
+    return Unit(path, module_name(path), defines, calls, includes, digest.hexdigest())
+
+def transpile_unit(root, unit, include_paths):
+    full_path = os.path.join(root, unit.path)
+    with open(full_path, encoding="utf-8") as file:
+        ast = Parser(Preprocessor(file.read(), full_path, include_paths).tokenize()).parse()
+
+    qualified = {
+        name: f"{module}.{name}" for module in unit.qualified for name in unit.imports[module]
+    }
+    for node in walk(ast):
+        if isinstance(node, FunctionCall) and node.name in qualified:
+            node.name = qualified[node.name]
+    code = CodeGenerator().generate(ast)
+
+    imports = "".join(
+        f"import {module}\n" if module in unit.qualified else f"from {module} import {', '.join(sorted(names))}\n"
+        for module, names in sorted(unit.imports.items())
+    )
+    return f"{imports}\n\n{code}" if imports else code
+
+# -----------------------------
+# PROJECT CLASS
+# -----------------------------
+
+class Project:
+    def __init__(self, root, output_dir, include_paths=(), workers=None):
+        self.root = os.path.realpath(root)
+        self.output_dir = output_dir
+        self.include_paths = [os.path.realpath(path) for path in include_paths]
+        self.workers = workers
+        self.units = {}         # module -> Unit
+        self.graph = {}         # module -> modules it depends on
+        self.cycles = {}        # module -> the other modules of the dependency cycle it is in (usually none)
+
+    def sources(self):
+        paths = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(SOURCE_EXTENSIONS):
+                    paths.append(os.path.relpath(os.path.join(directory, name), self.root))
+        return sorted(paths)
+
+    # -----------------------------
+    # DEPENDENCY GRAPH
+    # -----------------------------
+
+    # a unit depends on another one when it calls a function it does not define itself and the other one does
+    def build_graph(self, units):
+        self.units = {unit.module: unit for unit in units}
+        owners = function_owners(units)
+
+        self.graph = {}
+        for unit in units:
+            unit.imports = {}
+            for name in sorted(unit.calls - unit.defines):
+                modules = owners.get(name)
+                if not modules:
+                    continue     # not defined anywhere in the project (a builtin, or an error python will report)
+                if len(modules) > 1:
+                    raise RuntimeError(f"{name} is defined in more than one file : {', '.join(sorted(modules))}")
+                unit.imports.setdefault(modules[0], set()).add(name)
+            self.graph[unit.module] = set(unit.imports)
+
+        reachable = {module: self.reachable(module) for module in self.graph}
+        self.cycles = {
+            module: {other for other in reachable[module] if module in reachable[other]} - {module}
+            for module in self.graph
+        }
+        for unit in units:
+            unit.qualified = set(unit.imports) & self.cycles[unit.module]
+        return self.graph
+
+    def reachable(self, module):
+        seen = set()
+        stack = [module]
+        while stack:
+            for dep in self.graph[stack.pop()]:
+                if dep not in seen:
+                    seen.add(dep)
+                    stack.append(dep)
+        return seen
+
+    def waves(self):
+        # groups modules so that every module comes after the modules it depends on (Kahn's algorithm, level by level)
+        # the modules of a cycle wait for the dependencies of the whole cycle, so they all land in the same wave
+        remaining = {}
+        for module in self.graph:
+            group = {module} | self.cycles[module]
+            remaining[module] = set().union(*(self.graph[member] for member in group)) - group
+        waves = []
+        while remaining:
+            wave = sorted(module for module, deps in remaining.items() if not deps)
+            waves.append(wave)
+            for module in wave:
+                del remaining[module]
+            for deps in remaining.values():
+                deps.difference_update(wave)
+        return waves
+
+    # -----------------------------
+    # BUILD
+    # -----------------------------
+
+    # A module is rebuilt when its key changed. The key covers the file, its headers, what it imports,
+    # and the keys of the modules it depends on, so a change ripples down to every dependent module.
+    def build(self, force=False):
+        manifest_path = os.path.join(self.output_dir, MANIFEST)
+        manifest = {}
+        if not force and os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as file:
+                manifest = json.load(file)
+
+        with self.executor() as executor:
+            built, skipped, failed = [], [], []
+            errors = {}         # path -> message, for the files that failed themselves (not because of a dependency)
+
+            # the graph needs every file, so one that does not even parse stops the build before anything is written
+            units = []
+            futures = [(path, executor.submit(scan_unit, self.root, path, self.include_paths))
+                       for path in self.sources()]
+            for path, future in futures:
+                try:
+                    units.append(future.result())
+                except Exception as error:
+                    errors[path] = str(error)
+            # as is a file calling a function that several files define, build_graph() cannot tell which one it means
+            owners = function_owners(units)
+            for unit in units:
+                for name in sorted(unit.calls - unit.defines):
+                    modules = owners.get(name, [])
+                    if len(modules) > 1:
+                        errors[unit.path] = f"{name} is defined in more than one file : {', '.join(sorted(modules))}"
+            if errors:
+                return {"built": built, "skipped": skipped, "failed": sorted(errors), "errors": errors}
+            self.build_graph(units)
+
+            keys = {}
+            for wave in self.waves():
+                pending = []
+                for module in wave:
+                    unit = self.units[module]
+                    if any(dep in failed for dep in self.graph[module]):
+                        failed.append(module)
+                        continue
+                    keys[module] = self.key(unit, keys)
+                    if manifest.get(unit.path) == keys[module] and os.path.exists(self.output_path(unit)):
+                        skipped.append(module)
+                    else:
+                        pending.append(unit)
+
+                futures = [(unit, executor.submit(transpile_unit, self.root, unit, self.include_paths))
+                           for unit in pending]
+                for unit, future in futures:
+                    try:
+                        self.write(unit, future.result())
+                    except Exception as error:
+                        failed.append(unit.module)
+                        errors[unit.path] = str(error)
+                        manifest.pop(unit.path, None)
+                        continue
+                    manifest[unit.path] = keys[unit.module]
+                    built.append(unit.module)
+
+                # a module whose cycle partner failed cannot be imported either
+                for module in wave:
+                    if module not in failed and self.cycles[module] & set(failed):
+                        failed.append(module)
+                        manifest.pop(self.units[module].path, None)
+                        if module in built:
+                            built.remove(module)
+                        else:
+                            skipped.remove(module)
+
+        # forget files that were removed from the project
+        manifest = {path: key for path, key in manifest.items()
+                    if any(unit.path == path for unit in self.units.values())}
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(manifest_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=2, sort_keys=True)
+
+        return {"built": built, "skipped": skipped, "failed": failed, "errors": errors}
+
+    def key(self, unit, keys):
+        # a module of the same cycle has no key yet (it is in the same wave), its file stands in for it
+        digest = hashlib.sha256(unit.digest.encode())
+        for module, names in sorted(unit.imports.items()):
+            dep = self.units[module].digest if module in unit.qualified else keys[module]
+            digest.update(f"{module}:{','.join(sorted(names))}:{dep}".encode())
+        return digest.hexdigest()
+
+    def output_path(self, unit):
+        return os.path.join(self.output_dir, *unit.module.split(".")) + ".py"
+
+    def write(self, unit, code):
+        path = self.output_path(unit)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # sub directories become packages, so that "from util.math import ..." resolves
+        directory = os.path.dirname(path)
+        while os.path.realpath(directory) != os.path.realpath(self.output_dir):
+            init = os.path.join(directory, "__init__.py")
+            if not os.path.exists(init):
+                open(init, "w").close()
+            directory = os.path.dirname(directory)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(code)
+
+    def executor(self):
+        if self.workers == 1:
+            return InlineExecutor()
+        return ProcessPoolExecutor(max_workers=self.workers)
+
+def function_owners(units):
+    # function name -> modules defining it
+    owners = {}
+    for unit in units:
+        for name in unit.defines:
+            owners.setdefault(name, []).append(unit.module)
+    return owners
+
+class InlineExecutor:
+    # runs everything in this process, same interface as the parts of ProcessPoolExecutor used above
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, function, *args):
+        return InlineFuture(function, args)
+
+class InlineFuture:
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+
+    def result(self):
+        return self.function(*self.args)
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description="Transpile every .cpp file of a project into python modules")
+    arguments.add_argument("root", help="directory holding the cpp sources")
+    arguments.add_argument("output", help="directory the python modules are written to")
+    arguments.add_argument("-I", dest="include_paths", action="append", default=[], help="extra include directory")
+    arguments.add_argument("-j", dest="workers", type=int, default=None, help="worker processes (default: cpu count)")
+    arguments.add_argument("--force", action="store_true", help="rebuild everything, ignoring the manifest")
+    options = arguments.parse_args()
+
+    result = Project(options.root, options.output, options.include_paths, options.workers).build(options.force)
+    for path, message in result["errors"].items():
+        print(f"{path}: {message}")
+    print(f"built {len(result['built'])}, up to date {len(result['skipped'])}, failed {len(result['failed'])}")
+    if result["failed"]:
+        raise SystemExit(1)
@@ -0,0 +1,139 @@
+# this document maps generated python lines back to the cpp source they came from
+# the encoding follows javascript source maps (version 3), so editors and tools that already read those can read ours
+from dataclasses import dataclass
+
+from lexer import Span
+
+# -----------------------------
+# BASE64 VLQ ENCODING
+# -----------------------------
+
+# every number is split into 5 bit groups, lowest group first, the 6th bit says "more groups follow"
+# the sign is stored in the lowest bit of the first group
+BASE64 = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+BASE64_INDEX = {char: index for index, char in enumerate(BASE64)}
+
+def encode_vlq(value):
+    value = (-value << 1) | 1 if value < 0 else value << 1
+    encoded = ""
+    while True:
+        digit = value & 0b11111
+        value >>= 5
+        if value:
+            digit |= 0b100000
+        encoded += BASE64[digit]
+        if not value:
+            return encoded
+
+def decode_vlq(segment):
+    values = []
+    value = shift = 0
+    for char in segment:
+        digit = BASE64_INDEX[char]
+        value += (digit & 0b11111) << shift
+        if digit & 0b100000:
+            shift += 5
+            continue
+        values.append(-(value >> 1) if value & 1 else value >> 1)
+        value = shift = 0
+    return values
+
+# -----------------------------
+# SOURCE MAP
+# -----------------------------
+
+@dataclass
+class Mapping:
+    line: int           # python line, 1-based
+    column: int         # first python column of the construct, 0-based
+    end_column: int     # column just after the generated line's text
+    span: Span          # cpp source it came from
+
+class SourceMap:
+    def __init__(self):
+        self.mappings = []
+
+    def add(self, line, column, end_column, span):
+        self.mappings.append(Mapping(line, column, end_column, span))
+
+    def lookup(self, line):
+        # cpp span a python line came from, or None for lines with no origin (blank lines, etc.)
+        for mapping in self.mappings:
+            if mapping.line == line:
+                return mapping.span
+        return None
+
+    # -----------------------------
+    # ENCODING
+    # -----------------------------
+
+    def sources(self):
+        # files in order of first appearance, None standing for code that was passed in directly
+        sources = []
+        for mapping in self.mappings:
+            if mapping.span.source not in sources:
+                sources.append(mapping.span.source)
+        return sources
+
+    # Each python line gets two segments : the first points at the start of the span,
+    # the second (placed at the end of the python line) points at the end of the span.
+    # source maps use 0-based lines and columns, our spans are 1-based
+    def encode(self):
+        sources = self.sources()
+        lines = []
+        previous = [0, 0, 0]     # source index, source line, source column (these carry across lines)
+        by_line = {mapping.line: mapping for mapping in self.mappings}
+        last_line = max(by_line, default=0)
+
+        for line in range(1, last_line + 1):
+            mapping = by_line.get(line)
+            if mapping is None:
+                lines.append("")
+                continue
+            span = mapping.span
+            source_index = sources.index(span.source)
+            segments = []
+            generated_column = 0
+            for column, source_line, source_column in (
+                    (mapping.column, span.line - 1, span.column - 1),
+                    (mapping.end_column, span.end_line - 1, span.end_column - 1),
+            ):
+                fields = [column - generated_column, source_index - previous[0],
+                          source_line - previous[1], source_column - previous[2]]
+                segments.append("".join(encode_vlq(field) for field in fields))
+                generated_column = column
+                previous = [source_index, source_line, source_column]
+            lines.append(",".join(segments))
+
+        return ";".join(lines)
+
+    def to_dict(self, file=None, source="input.cpp"):
+        return {
+            "version": 3,
+            "file": file or "",
+            "sources": [source if name is None else name for name in self.sources()],
+            "names": [],
+            "mappings": self.encode(),
+        }
+
+def decode_mappings(mappings):
+    # turns an encoded mappings string back into
+    # {python line: (source index, start line, start column, end line, end column)}
+    # (lines and columns 1-based, the same as Span). offsets are not stored in source maps, so they are not recovered
+    decoded = {}
+    source_index = source_line = source_column = 0
+
+    for index, line in enumerate(mappings.split(";"), start=1):
+        if not line:
+            continue
+        points = []
+        for segment in line.split(","):
+            fields = decode_vlq(segment)
+            source_index += fields[1]
+            source_line += fields[2]
+            source_column += fields[3]
+            points.append((source_line + 1, source_column + 1))
+        start, end = points[0], points[-1]
+        decoded[index] = (source_index, start[0], start[1], end[0], end[1])
+
+    return decoded
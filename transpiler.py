@@ -1,15 +1,38 @@
-from lexer import Lexer
+from preprocessor import Preprocessor
 from parser import Parser
+from optimizer import optimize
 from main import CodeGenerator
+from limits import Budget, BudgetExceeded
 
-def transpile_code(source_code: str) -> str:
-    lexer = Lexer(source_code)
-    tokens = lexer.tokenize()
+def transpile_code(source_code: str, filename=None, include_paths=(), opt_level=0, limits=None) -> str:
+    output_code, _ = transpile_with_source_map(source_code, filename, include_paths, opt_level, limits)
+    return output_code
 
-    parser = Parser(tokens)
-    ast = parser.parse()
+def transpile_with_source_map(source_code: str, filename=None, include_paths=(), opt_level=0, limits=None):
+    # same as transpile_code, but also returns the source map (a dict, see sourcemap.py) of python lines → cpp spans
+    # filename is where source_code was read from, local #include "..." files are looked up next to it and in include_paths
+    # opt_level picks the optimizations run on the AST (see optimizer.py), 0 keeps it as parsed
+    # limits (see limits.py) bound the work done, every stage stops with BudgetExceeded once one is crossed
+    budget = Budget(limits)
+    stage = "preprocessor"
 
-    generator = CodeGenerator()
-    output_code = generator.generate(ast)
+    try:
+        preprocessor = Preprocessor(source_code, filename, include_paths, budget=budget)
+        tokens = preprocessor.tokenize()
 
-    return output_code
\ No newline at end of file
+        stage = "parser"
+        parser = Parser(tokens, budget)
+        ast = parser.parse()
+
+        stage = "optimizer"
+        ast = optimize(ast, opt_level, budget)
+        budget.check_time("optimizer")
+
+        stage = "generator"
+        generator = CodeGenerator(bind_locals=opt_level >= 3, budget=budget)
+        output_code = generator.generate(ast)
+    except RecursionError:
+        # the depth budget is meant to stop deep input before python does, this catches what it does not count
+        raise BudgetExceeded("depth", budget.limits.max_depth, stage) from None
+
+    return output_code, generator.source_map.to_dict(source=filename or "input.cpp")